@@ -0,0 +1,140 @@
+"""Benchmarks how a resumable upload reads and sizes its chunks, against a local
+stand-in for the YouTube upload endpoint.
+
+    python benchmark.py [size in MiB]
+
+Creates a sparse file (1024 MiB by default), uploads it once with every strategy,
+each in its own process, and prints the throughput and the peak RSS of that process.
+"""
+import json
+import os
+import re
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from googleapiclient.http import HttpRequest, MediaFileUpload, build_http
+
+from resumable import MAX_CHUNK_SIZE, MappedFileUpload, send_chunk
+
+
+class CopiedFileUpload(MediaFileUpload):
+    """MediaFileUpload that reads every chunk into a new bytes object"""
+
+    def has_stream(self):
+        return False
+
+
+STRATEGIES = {
+    # the fixed 1,000,000 byte chunks of simple_youtube_api's calculate_chunk_size
+    "library": lambda path: MediaFileUpload(path, chunksize=1000000, resumable=True),
+    # the biggest chunks program.py sends, copied out of the file
+    "copied": lambda path: CopiedFileUpload(path, chunksize=MAX_CHUNK_SIZE, resumable=True),
+    # what program.py does, views of a memory map sized from the throughput
+    "mapped": lambda path: MappedFileUpload(path),
+}
+
+
+class ResumableEndpoint(BaseHTTPRequestHandler):
+    """Accepts resumable uploads like the YouTube upload endpoint and drops the bytes"""
+
+    protocol_version = "HTTP/1.1"
+    sessions = {}
+
+    def log_message(self, *args):
+        pass
+
+    def read_body(self):
+        left = int(self.headers.get("Content-Length") or 0)
+        while left:
+            left -= len(self.rfile.read(min(left, 1 << 20)))
+
+    def reply(self, status, headers=(), body=b""):
+        self.send_response(status)
+        for name, value in headers:
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        self.read_body()
+        session = "/session/{}".format(len(self.sessions))
+        self.sessions[session] = int(self.headers["X-Upload-Content-Length"])
+        port = self.server.server_address[1]
+        self.reply(200, [("Location", "http://127.0.0.1:{}{}".format(port, session))])
+
+    def do_PUT(self):
+        self.read_body()
+        end = int(re.match(r"bytes \d+-(\d+)/", self.headers["Content-Range"]).group(1))
+        if end + 1 == self.sessions[self.path]:
+            self.reply(200, [("Content-Type", "application/json")], b'{"id": "benchmark"}')
+        else:
+            self.reply(308, [("Range", "bytes=0-{}".format(end))])
+
+
+def upload(strategy, url, file_path):
+    # runs in its own process so the peak RSS is only this strategy's
+    media = STRATEGIES[strategy](file_path)
+    request = HttpRequest(
+        build_http(),
+        lambda resp, content: json.loads(content),
+        url,
+        method="POST",
+        body="{}",
+        headers={"content-type": "application/json"},
+        resumable=media,
+    )
+    chunks, response = 0, None
+    start = time.monotonic()
+    while response is None:
+        if strategy == "mapped":
+            _, response = send_chunk(request)
+        else:
+            _, response = request.next_chunk()
+        chunks += 1
+    seconds = time.monotonic() - start
+    # ru_maxrss is in KiB on Linux
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    print(json.dumps({"seconds": seconds, "chunks": chunks, "peak_rss": peak_rss}))
+
+
+def main(size_mib):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), ResumableEndpoint)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = "http://127.0.0.1:{}/upload".format(server.server_address[1])
+
+    with tempfile.TemporaryDirectory() as directory:
+        file_path = os.path.join(directory, "sparse.bin")
+        with open(file_path, "wb") as f:
+            f.truncate(size_mib * 1024 * 1024)
+
+        print("{:<10}{:>10}{:>12}{:>16}".format("strategy", "chunks", "MB/s", "peak RSS MiB"))
+        for strategy in STRATEGIES:
+            output = subprocess.run(
+                [sys.executable, __file__, "--run", strategy, url, file_path],
+                check=True,
+                capture_output=True,
+                text=True,
+            ).stdout
+            result = json.loads(output)
+            print(
+                "{:<10}{:>10}{:>12.1f}{:>16.1f}".format(
+                    strategy,
+                    result["chunks"],
+                    size_mib * 1024 * 1024 / result["seconds"] / 1e6,
+                    result["peak_rss"] / 1024 / 1024,
+                )
+            )
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--run"]:
+        upload(*sys.argv[2:5])
+    else:
+        main(int(sys.argv[1]) if len(sys.argv) > 1 else 1024)
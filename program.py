@@ -1,38 +1,469 @@
-from simple_youtube_api.Channel import Channel
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import progressbar
+from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
+from googleapiclient.http import build_http
+from oauth2client.client import flow_from_clientsecrets
+from oauth2client.file import Storage
+from oauth2client.tools import run_flow
+
+from simple_youtube_api.Channel import (
+    API_SERVICE_NAME,
+    API_VERSION,
+    MAX_RETRIES,
+    RETRIABLE_EXCEPTIONS,
+    RETRIABLE_STATUS_CODES,
+    Channel,
+    generate_upload_body,
+)
 from simple_youtube_api.LocalVideo import LocalVideo
+from simple_youtube_api.YouTubeVideo import YouTubeVideo
+from simple_youtube_api.youtube_constants import SCOPES
+
+from resumable import MAX_CHUNK_SIZE, MappedFileUpload, failed_chunk_size, send_chunk
+
+CLIENT_SECRET = "client_secret.json"
+CREDENTIALS = "credentials.storage"
+
+# files that are going to be uploaded
+VIDEO_FILES = ["video.webm"]
+
+# how many uploads run at the same time
+MAX_WORKERS = 4
+
+# remembers which files were already uploaded (channel id -> content hash and size -> video id)
+UPLOAD_INDEX = "uploads.index.json"
+
+# remembers the resumable session of every unfinished upload (path, size and mtime ->
+# session uri and sent bytes) so the next run continues where the last one stopped
+UPLOAD_JOURNAL = "uploads.journal.json"
+
+# loading the credentials once, the first time this opens the browser to log in.
+# all workers share these credentials (and the lock of this one storage) so when
+# the token expires it is refreshed and written to the file only once
+storage = Storage(CREDENTIALS)
+credentials = storage.get()
+if credentials is None or credentials.invalid:
+    credentials = run_flow(flow_from_clientsecrets(CLIENT_SECRET, scope=SCOPES), storage)
+
+
+def login():
+    # httplib2 is not thread safe, so every channel gets its own authorized http object.
+    # build_http doesn't follow 308 responses, the resumable upload answers every
+    # chunk with one and a plain httplib2.Http would treat it as a broken redirect
+    channel = Channel()
+    channel.channel = build(API_SERVICE_NAME, API_VERSION, http=credentials.authorize(build_http()))
+    return channel
+
+
+# 403 reasons that mean the daily quota is used up, and ones that mean too many requests
+QUOTA_REASONS = ("quotaExceeded", "dailyLimitExceeded")
+RATE_LIMIT_REASONS = ("rateLimitExceeded", "userRateLimitExceeded")
+
+# once the daily quota is used up no worker sends anything anymore, unfinished
+# uploads stay in the journal and continue in the next run
+quota_exceeded = threading.Event()
+
+# after a rate limit every worker waits until this time before sending again
+throttled_until = 0
+throttle_lock = threading.Lock()
+
+
+def error_reason(e):
+    try:
+        return json.loads(e.content)["error"]["errors"][0]["reason"]
+    except (ValueError, KeyError, IndexError, TypeError):
+        return None
+
+
+def call_api(label, function, *args, on_retry=None, **kwargs):
+    # every request of this script goes through here, retrying with exponential
+    # backoff like simple_youtube_api does and handling quota and rate limits for
+    # all workers at once. label says what the request is for in the messages
+    global throttled_until
+    retry = 0
+    while True:
+        if quota_exceeded.is_set():
+            raise Exception("The daily quota is used up, skipping {}".format(label))
+        delay = throttled_until - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+        try:
+            return function(*args, **kwargs)
+        except HttpError as e:
+            reason = error_reason(e)
+            if reason in QUOTA_REASONS:
+                quota_exceeded.set()
+                raise
+            if e.resp.status not in RETRIABLE_STATUS_CODES and reason not in RATE_LIMIT_REASONS:
+                raise
+            error = "A retriable HTTP error %d occurred:\n%s" % (e.resp.status, e.content)
+        except RETRIABLE_EXCEPTIONS as e:
+            reason = None
+            error = "A retriable error occurred: %s" % e
+
+        print("{}: {}".format(label, error))
+        if on_retry is not None:
+            on_retry()
+        retry += 1
+        if retry > MAX_RETRIES:
+            raise Exception("Giving up on {} after {} retries".format(label, MAX_RETRIES))
+        sleep_seconds = random.random() * 2 ** retry
+        if reason in RATE_LIMIT_REASONS:
+            with throttle_lock:
+                throttled_until = max(throttled_until, time.monotonic() + sleep_seconds)
+        else:
+            time.sleep(sleep_seconds)
+
 
 # loggin into the channel
-channel = Channel()
-channel.login("client_secret.json", "credentials.storage")
-
-# setting up the video that is going to be uploaded
-video = LocalVideo(file_path="video.webm")
-
-# setting snippet
-video.set_title("My Filemanager Built Using Laravel Livewire")
-video.set_description("I have built a filemanager using laravel livewire")
-video.set_tags(["this", "tag"])
-video.set_category("gaming")
-video.set_default_language("en-US")
-
-# setting status
-video.set_embeddable(True)
-# if we don't want to make video license free then we can keep it to standard. 
-# video.set_license("creativeCommon") Creative Common means anybody can use the video on their channel.
-video.set_privacy_status("private")
-video.set_public_stats_viewable(True)
-
-# setting thumbnail
-# video.set_thumbnail_path("test_thumb.png") // you can set the thumbnail
-# video.set_playlist("PLDjcYN-DQyqTeSzCg-54m4stTVyQaJrGi")
-
-# uploading video and printing the results
-video = channel.upload_video(video)
-print(video.id)
-print(video)
-
-# liking video
-video.like() 
-# this will cost you an extra token so if you want you can do like as well.
-
-# let me resolve this isssue 
\ No newline at end of file
+channel = login()
+request = channel.get_login().channels().list(mine=True, part="id")
+channel_id = call_api("channels.list", request.execute)["items"][0]["id"]
+
+# every worker thread logs in with its own channel
+local = threading.local()
+
+
+def get_channel():
+    if not hasattr(local, "channel"):
+        local.channel = login()
+    return local.channel
+
+
+def load_json(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_json(path, data):
+    # writing to a temporary file first so a crash never leaves half a file behind
+    with open(path + ".tmp", "w") as f:
+        json.dump(data, f, indent=2)
+    os.replace(path + ".tmp", path)
+
+
+def file_key(file_path, block_size=1 << 20):
+    # hashing the file in blocks so big videos don't have to fit in memory
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return "{}:{}".format(digest.hexdigest(), os.path.getsize(file_path))
+
+
+class HashingFileUpload(MappedFileUpload):
+    """MappedFileUpload that hashes the file while its chunks are read for the upload,
+    so a new file is not read an extra time just for the index
+    """
+
+    def __init__(self, file_path):
+        MappedFileUpload.__init__(self, file_path)
+        self.digest = hashlib.sha256()
+        self.hashed = 0
+
+    def getbytes(self, begin, length):
+        # a resumed upload starts after bytes this run hasn't read yet
+        self.hash_until(begin)
+        data = MappedFileUpload.getbytes(self, begin, length)
+        # chunks that are sent again after an error are only hashed once
+        if begin <= self.hashed < begin + len(data):
+            self.digest.update(data[self.hashed - begin:])
+            self.hashed = begin + len(data)
+        return data
+
+    def hash_until(self, end):
+        while self.hashed < end:
+            data = MappedFileUpload.getbytes(self, self.hashed, min(end - self.hashed, MAX_CHUNK_SIZE))
+            self.digest.update(data)
+            self.hashed += len(data)
+
+    def key(self):
+        # same as file_key once the whole file has been read
+        self.hash_until(self.size())
+        return "{}:{}".format(self.digest.hexdigest(), self.size())
+
+
+def journal_key(file_path):
+    stat = os.stat(file_path)
+    return "{}:{}:{}".format(os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns)
+
+
+index = load_json(UPLOAD_INDEX)
+uploaded = index.setdefault(channel_id, {})
+index_lock = threading.Lock()
+
+# only files with the same size can have the same content, so files with the same size
+# are handled one after the other (size -> lock) and a later one finds the first one in
+# the index instead of uploading it again
+size_locks = {}
+
+journal = load_json(UPLOAD_JOURNAL)
+journal_lock = threading.Lock()
+
+
+def save_session(key, request):
+    with journal_lock:
+        if request is None:
+            journal.pop(key, None)
+        else:
+            journal[key] = {
+                "resumable_uri": request.resumable_uri,
+                "resumable_progress": request.resumable_progress,
+            }
+        save_json(UPLOAD_JOURNAL, journal)
+
+
+def file_size(file_path):
+    # a missing file counts as empty here, its upload then fails on its own
+    try:
+        return os.path.getsize(file_path)
+    except OSError:
+        return 0
+
+
+# one progress bar for the whole batch, every worker adds the bytes it has sent.
+# redirect_stdout keeps prints from the workers above the bar
+sent = {}
+sent_lock = threading.Lock()
+bar = progressbar.ProgressBar(
+    widgets=[
+        "Upload: ",
+        progressbar.Percentage(),
+        " ",
+        progressbar.Bar(marker=progressbar.RotatingMarker()),
+        " ",
+        progressbar.ETA(),
+        " ",
+        progressbar.FileTransferSpeed(),
+    ],
+    max_value=sum(file_size(path) for path in VIDEO_FILES),
+    redirect_stdout=True,
+)
+
+
+def report_progress(file_path, bytes_sent):
+    with sent_lock:
+        sent[file_path] = bytes_sent
+        bar.update(sum(sent.values()))
+
+
+def make_video(file_path):
+    # setting up the video that is going to be uploaded
+    video = LocalVideo(file_path=file_path)
+
+    # setting snippet
+    video.set_title("My Filemanager Built Using Laravel Livewire")
+    video.set_description("I have built a filemanager using laravel livewire")
+    video.set_tags(["this", "tag"])
+    video.set_category("gaming")
+    video.set_default_language("en-US")
+
+    # setting status
+    video.set_embeddable(True)
+    # if we don't want to make video license free then we can keep it to standard.
+    # video.set_license("creativeCommon") Creative Common means anybody can use the video on their channel.
+    video.set_privacy_status("private")
+    video.set_public_stats_viewable(True)
+
+    # setting thumbnail
+    # video.set_thumbnail_path("test_thumb.png") // you can set the thumbnail
+    # video.set_playlist("PLDjcYN-DQyqTeSzCg-54m4stTVyQaJrGi")
+    return video
+
+
+def resume_session(request, resumable_uri, file_size):
+    # asking the server how much of the file it got before the last run stopped,
+    # returns the response if the upload had already finished
+    resp, content = request.http.request(
+        resumable_uri,
+        "PUT",
+        headers={"Content-Range": "bytes */{}".format(file_size), "content-length": "0"},
+    )
+    if resp.status in RETRIABLE_STATUS_CODES:
+        raise HttpError(resp, content, uri=resumable_uri)
+    if resp.status in (200, 201):
+        return json.loads(content)
+    if resp.status == 308:
+        request.resumable_uri = resumable_uri
+        if "range" in resp:
+            request.resumable_progress = int(resp["range"].split("-")[1]) + 1
+    # any other status means the session expired, so the upload starts over
+    return None
+
+
+def send_chunks(request, file_path, key):
+    # sending the file chunk by chunk, send_chunk sizes every chunk from how fast the
+    # last one went and every error halves it. after an error next_chunk first asks
+    # the server how much of the file it already has and continues from there
+    media = request.resumable
+
+    def shrink():
+        media.chunk_size = failed_chunk_size(media.chunk_size)
+
+    while True:
+        status, response = call_api(file_path, send_chunk, request, num_retries=4, on_retry=shrink)
+        if response is not None:
+            return response
+        save_session(key, request)
+        report_progress(file_path, status.resumable_progress)
+
+
+def insert_video(channel, video):
+    # returns the new video and the content key of the file
+    body = generate_upload_body(video)
+    media = HashingFileUpload(video.file_path)
+    try:
+        response = send_video(channel, video, body, media)
+        key = media.key()
+    finally:
+        media.close()
+    if "id" not in response:
+        raise Exception("The upload failed unexpectedly: {}".format(response))
+    report_progress(video.file_path, os.path.getsize(video.file_path))
+
+    return YouTubeVideo(response["id"], channel=channel.get_login()), key
+
+
+def update_video(channel, video, youtube_video):
+    # applying the snippet and status of this run to a video that is already uploaded,
+    # returns the error if it fails
+    body = generate_upload_body(video)
+    part = ",".join(body.keys())
+    body["id"] = youtube_video.id
+    request = channel.get_login().videos().update(part=part, body=body)
+    try:
+        call_api(video.file_path, request.execute)
+    except Exception as e:
+        return e
+    return None
+
+
+def follow_up(channel, video, youtube_video):
+    # setting the thumbnail and playlist of a new video, returns the error if one fails
+    try:
+        if video.thumbnail_path is not None:
+            call_api(video.file_path, channel.set_video_thumbnail, youtube_video, video.thumbnail_path)
+        if video.playlist_id is not None:
+            call_api(video.file_path, channel.add_video_to_playlist, video.playlist_id, youtube_video)
+    except Exception as e:
+        return e
+    return None
+
+
+def send_video(channel, video, body, media):
+    request = channel.get_login().videos().insert(
+        part=",".join(body.keys()), body=body, media_body=media
+    )
+    key = journal_key(video.file_path)
+    with journal_lock:
+        session = journal.get(key)
+    response = None
+    if session is not None:
+        response = call_api(
+            video.file_path,
+            resume_session,
+            request,
+            session["resumable_uri"],
+            os.path.getsize(video.file_path),
+        )
+        report_progress(video.file_path, request.resumable_progress)
+    if response is None:
+        response = send_chunks(request, video.file_path, key)
+    return response
+
+
+def is_on_channel(video_id):
+    # the video might have been deleted or rejected since it was uploaded
+    request = get_channel().get_login().videos().list(id=video_id, part="status")
+    response = call_api(video_id, request.execute)
+    return any(
+        item["status"]["uploadStatus"] not in ("deleted", "failed", "rejected")
+        for item in response.get("items", [])
+    )
+
+
+def find_or_upload(file_path, size):
+    # returning the video that is already on the channel, or uploading the file
+    local_video = make_video(file_path)
+    with index_lock:
+        known_size = any(key.endswith(":{}".format(size)) for key in uploaded)
+    # only a file with the same size as an uploaded one is hashed before the upload,
+    # every other file is hashed while it is uploaded
+    if known_size:
+        video_id = uploaded.get(file_key(file_path))
+        if video_id is not None and is_on_channel(video_id):
+            report_progress(file_path, size)
+            video = YouTubeVideo(id=video_id, channel=get_channel().get_login())
+            return video, True, update_video(get_channel(), local_video, video)
+
+    # the video is on the channel as soon as the insert returns, so it goes into the
+    # index before the thumbnail and playlist, which can still fail on their own
+    video, key = insert_video(get_channel(), local_video)
+    with index_lock:
+        uploaded[key] = video.id
+        save_json(UPLOAD_INDEX, index)
+    # the session stays in the journal until now, so a run that stops between the
+    # last chunk and the index still finds the finished upload through it
+    save_session(journal_key(file_path), None)
+    return video, False, follow_up(get_channel(), local_video, video)
+
+
+def upload(file_path):
+    # returns the video, whether it was already uploaded before and the error of
+    # updating it, or of its thumbnail or playlist, if that failed
+    size = os.path.getsize(file_path)
+    with index_lock:
+        size_lock = size_locks.setdefault(size, threading.Lock())
+    with size_lock:
+        return find_or_upload(file_path, size)
+
+
+# uploading the videos and printing the results as they finish
+results = {}
+bar.start()
+with ThreadPoolExecutor(max_workers=MAX_WORKERS) as pool:
+    futures = {pool.submit(upload, path): path for path in VIDEO_FILES}
+    for done, future in enumerate(as_completed(futures), 1):
+        path = futures[future]
+        try:
+            results[path] = future.result()
+            video, reused, error = results[path]
+            if reused:
+                print("[{}/{}] {} already uploaded as {}".format(done, len(futures), path, video.id))
+            else:
+                print("[{}/{}] {} -> {}".format(done, len(futures), path, video.id))
+            if error is not None:
+                print("    the video is on the channel, but updating it failed: {}".format(error))
+        except Exception as e:
+            results[path] = e
+            print("[{}/{}] {} failed: {}".format(done, len(futures), path, e))
+bar.finish()
+
+for path, result in results.items():
+    if isinstance(result, Exception):
+        continue
+    video, reused, _ = result
+    print(video)
+
+    # liking only the new videos
+    if reused:
+        continue
+    video.set_channel_auth(channel.get_login())
+    try:
+        call_api(path, video.like)
+    except Exception as e:
+        print("{}: could not like {}: {}".format(path, video.id, e))
+    # this will cost you an extra token so if you want you can do like as well.
+
+# let me resolve this isssue
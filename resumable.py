@@ -0,0 +1,87 @@
+"""Reading and sizing the chunks of a resumable upload.
+
+The resumable upload protocol wants every chunk except the last one to be a
+multiple of 256 KiB. Chunks start at FIRST_CHUNK_SIZE and are then sized from
+how fast the previous chunk went, so a fast link sends few big chunks and a slow
+or flaky one sends small chunks that are cheap to send again.
+"""
+import mimetypes
+import mmap
+import time
+
+from googleapiclient.http import MediaIoBaseUpload
+
+CHUNK_UNIT = 256 * 1024
+MIN_CHUNK_SIZE = 4 * CHUNK_UNIT  # 1 MiB
+MAX_CHUNK_SIZE = 256 * CHUNK_UNIT  # 64 MiB
+FIRST_CHUNK_SIZE = 32 * CHUNK_UNIT  # 8 MiB
+
+# every chunk is sized to take about this many seconds to send
+CHUNK_SECONDS = 5
+
+
+def round_chunk_size(chunk_size):
+    chunk_size = int(chunk_size) // CHUNK_UNIT * CHUNK_UNIT
+    return min(max(chunk_size, MIN_CHUNK_SIZE), MAX_CHUNK_SIZE)
+
+
+def next_chunk_size(chunk_size, sent, seconds):
+    # growing at most twice per chunk so one fast chunk doesn't jump straight to the maximum
+    if sent <= 0:
+        return chunk_size
+    return round_chunk_size(min(sent / max(seconds, 0.001) * CHUNK_SECONDS, chunk_size * 2))
+
+
+def failed_chunk_size(chunk_size):
+    # halving the chunk after an error so less has to be sent again
+    return round_chunk_size(chunk_size // 2)
+
+
+class MappedFileUpload(MediaIoBaseUpload):
+    """MediaFileUpload that hands out every chunk as a view of a memory map of
+    the file instead of a copy, chunk_size can be changed between chunks
+    """
+
+    def __init__(self, file_path, chunk_size=FIRST_CHUNK_SIZE, mimetype=None):
+        if mimetype is None:
+            mimetype = mimetypes.guess_type(file_path)[0] or "application/octet-stream"
+        MediaIoBaseUpload.__init__(
+            self, open(file_path, "rb"), mimetype, chunksize=chunk_size, resumable=True
+        )
+        self.chunk_size = chunk_size
+
+    def chunksize(self):
+        return self.chunk_size
+
+    def has_stream(self):
+        # httplib2 sends a request again by itself when the connection went stale,
+        # a view can be sent twice while a stream would already be read by then
+        return False
+
+    def getbytes(self, begin, length):
+        length = min(length, self.size() - begin)
+        if length <= 0:
+            return b""
+        # mapping only this chunk, it is unmapped again once the view is dropped
+        offset = begin - begin % mmap.ALLOCATIONGRANULARITY
+        chunk = mmap.mmap(
+            self._fd.fileno(), begin - offset + length, offset=offset, access=mmap.ACCESS_READ
+        )
+        return memoryview(chunk)[begin - offset:]
+
+    def close(self):
+        self._fd.close()
+
+
+def send_chunk(request, num_retries=0):
+    """Sends the next chunk of a request with a MappedFileUpload and sizes the
+    chunk after it from how long this one took
+    """
+    media = request.resumable
+    progress, start = request.resumable_progress, time.monotonic()
+    status, response = request.next_chunk(num_retries=num_retries)
+    if status is not None:
+        media.chunk_size = next_chunk_size(
+            media.chunk_size, status.resumable_progress - progress, time.monotonic() - start
+        )
+    return status, response